@@ -10,35 +10,63 @@ This is the main Flask application providing REST API endpoints for:
 Key yt-dlp options used:
 - format: Selects video+audio quality (e.g., 'bestvideo[height<=720]+bestaudio/best')
 - merge_output_format: Output container format (mp4, mkv, webm)
-- postprocessors: For audio extraction and conversion (FFmpegExtractAudio)
+- postprocessors: For audio extraction and conversion (FFmpegExtractAudio),
+  and optional subtitle/thumbnail embedding (FFmpegEmbedSubtitle, EmbedThumbnail)
 - concurrent_fragment_downloads: Parallel fragment downloading for speed
 - progress_hooks: Real-time progress callbacks
 
 Concurrency logic:
 - Uses ThreadPoolExecutor for parallel batch downloads
+- Metadata extraction for multiple URLs runs on a separate thread pool
 - Each download runs in its own thread with progress reporting
 - Downloads are tracked by unique IDs for status updates
-- Thread-safe queue for progress events (SSE streaming)
+- Thread-safe queue for progress events (SSE streaming), fanned out to
+  per-client queues by a single dispatcher thread
+- Opt-in gevent mode (USE_GEVENT=1, gevent installed separately): the
+  standard library is monkey-patched and the app is served by gevent's WSGI
+  server, so each connected SSE client parks a cheap greenlet instead of an
+  OS thread. Downloads and extraction then share one OS thread, so CPU-bound
+  yt-dlp work stalls other requests; the default threaded server avoids this
 """
 
 import os
+
+# Opt-in gevent mode; must patch before the remaining imports so
+# sockets/threads/queues are cooperative
+gevent = None
+WSGIServer = None
+if os.environ.get('USE_GEVENT', '').lower() in ('1', 'true', 'yes'):
+    from gevent import monkey
+    monkey.patch_all()
+    import gevent.queue
+    from gevent.pywsgi import WSGIServer
+
 import re
 import sys
+import atexit
 import json
 import time
-import uuid
+import secrets
 import queue
 import logging
 import threading
+import functools
+import contextlib
+from collections import deque
 from pathlib import Path
 from datetime import datetime
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Set, Iterator, Any
 
-from flask import Flask, request, jsonify, Response, send_from_directory
+from flask import Flask, request, jsonify, Response, send_from_directory, stream_with_context
 from flask_cors import CORS
 import yt_dlp
 
+try:
+    import orjson  # Fast JSON encoder for the SSE stream (optional)
+except ImportError:
+    orjson = None
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -58,19 +86,78 @@ CORS(app)
 # ============================================================================
 
 # Active downloads tracking: {download_id: download_info}
+# Insertions/removals rely on atomic dict operations; each record carries its
+# own 'lock' guarding field updates so downloads never contend with each other
 active_downloads: Dict[str, Dict] = {}
 
 # Progress event queues for SSE: {client_id: Queue}
 progress_queues: Dict[str, queue.Queue] = {}
 
-# Download history: stores completed/failed downloads
-download_history: List[Dict] = []
+# Immutable (client_id, Queue) snapshot of progress_queues, rebuilt only when
+# clients connect/disconnect so broadcasting never copies the dict
+_queues_snapshot: tuple = ()
+_queues_lock = threading.Lock()
+
+# Central progress event queue, drained by a single dispatcher thread that
+# fans events out to the per-client queues
+progress_events: queue.Queue = queue.Queue(maxsize=10000)
+
+# Events dropped per SSE client since it last consumed from its queue
+# (guarded by _queues_lock)
+drops_by_client: Dict[str, int] = {}
+
+# Seconds a terminal event may wait for room in the full central event queue
+# (client queues never wait, so one stalled client cannot block fan-out)
+TERMINAL_EVENT_TIMEOUT = 1.0
+
+# Pending events buffered per SSE client
+CLIENT_QUEUE_SIZE = 100
+
+# A client that stops consuming for this many dropped events is considered gone
+MAX_CLIENT_DROPS = 1000
+
+# Download history: stores the most recent completed downloads (bounded)
+HISTORY_LIMIT = 50
+download_history: deque = deque(maxlen=HISTORY_LIMIT)
+
+# Finished downloads are evicted from active_downloads after this many seconds
+DOWNLOAD_RETENTION_SECONDS = 30 * 60
+REAPER_INTERVAL_SECONDS = 60
+TERMINAL_STATES = {'completed': 'completed_at', 'failed': 'failed_at', 'cancelled': 'cancelled_at'}
+
+# Minimum seconds between 'downloading' progress events per download (<=10/s)
+PROGRESS_MIN_INTERVAL = 0.1
+
+
+def env_worker_count(name: str, default: int) -> int:
+    """
+    Read a worker count from the environment.
+    Falls back to the default on a non-integer value and clamps to at least 1.
+    """
+    raw = os.environ.get(name)
+    if raw is None:
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        logger.warning(f"Invalid {name}={raw!r}; using default {default}")
+        return default
+    if value < 1:
+        logger.warning(f"{name}={value} is below 1; using 1")
+        return 1
+    return value
+
+
+# Worker pool sizes (override via environment variables)
+MAX_CONCURRENT_DOWNLOADS = env_worker_count('MAX_CONCURRENT_DOWNLOADS', 8)
+MAX_CONCURRENT_INFO = env_worker_count('MAX_CONCURRENT_INFO', 16)
 
 # Thread pool for concurrent downloads
-executor = ThreadPoolExecutor(max_workers=5)
+download_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_DOWNLOADS, thread_name_prefix='dl')
 
-# Lock for thread-safe operations
-downloads_lock = threading.Lock()
+# Separate pool for metadata extraction (/api/info) so large download
+# batches never starve interactive info requests
+info_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_INFO, thread_name_prefix='info')
 
 # Default download directory
 DEFAULT_DOWNLOAD_DIR = str(Path.home() / "Downloads" / "VideoDownloader")
@@ -78,6 +165,26 @@ DEFAULT_DOWNLOAD_DIR = str(Path.home() / "Downloads" / "VideoDownloader")
 # Ensure default directory exists
 os.makedirs(DEFAULT_DOWNLOAD_DIR, exist_ok=True)
 
+# Directories already known to exist, so downloads skip repeated makedirs calls
+_known_dirs: Set[str] = {DEFAULT_DOWNLOAD_DIR}
+_known_dirs_lock = threading.Lock()
+
+# Translation tables for filename/URL sanitization (applied in C by str.translate)
+_FN_TRANS = str.maketrans({c: '_' for c in '/\\\0<>:"|?*'})
+_URL_TRANS = str.maketrans('', '', ';&|`$(){}[]!#')
+
+# Units for format_size, indexed by power of 1024
+_SIZE_UNITS = ('B', 'KB', 'MB', 'GB', 'TB', 'PB')
+
+# URL validation pattern (compiled once at import)
+_URL_RE = re.compile(
+    r'^https?://'  # http:// or https://
+    r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|'  # domain
+    r'localhost|'  # localhost
+    r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'  # or IP
+    r'(?::\d+)?'  # optional port
+    r'(?:/?|[/?]\S+)$', re.IGNORECASE)
+
 
 # ============================================================================
 # UTILITY FUNCTIONS
@@ -88,12 +195,8 @@ def sanitize_filename(filename: str) -> str:
     Sanitize filename to prevent path traversal and invalid characters.
     Removes or replaces characters that are invalid in Windows/Linux filenames.
     """
-    # Remove path separators and null bytes
-    filename = filename.replace('/', '_').replace('\\', '_').replace('\0', '')
-    # Remove other invalid Windows characters
-    invalid_chars = '<>:"|?*'
-    for char in invalid_chars:
-        filename = filename.replace(char, '_')
+    # Replace path separators, null bytes and other invalid Windows characters
+    filename = filename.translate(_FN_TRANS)
     # Limit length
     if len(filename) > 200:
         filename = filename[:200]
@@ -108,9 +211,7 @@ def sanitize_url(url: str) -> str:
     Only allows valid URL characters.
     """
     # Remove any shell metacharacters
-    dangerous_chars = [';', '&', '|', '`', '$', '(', ')', '{', '}', '[', ']', '!', '#']
-    for char in dangerous_chars:
-        url = url.replace(char, '')
+    url = url.translate(_URL_TRANS)
     return url.strip()
 
 
@@ -118,25 +219,29 @@ def validate_url(url: str) -> bool:
     """
     Validate that string is a valid URL format.
     """
-    url_pattern = re.compile(
-        r'^https?://'  # http:// or https://
-        r'(?:(?:[A-Z0-9](?:[A-Z0-9-]{0,61}[A-Z0-9])?\.)+[A-Z]{2,6}\.?|'  # domain
-        r'localhost|'  # localhost
-        r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3})'  # or IP
-        r'(?::\d+)?'  # optional port
-        r'(?:/?|[/?]\S+)$', re.IGNORECASE)
-    return url_pattern.match(url) is not None
+    # Cheap prefix check rejects most garbage without touching the regex
+    if not url[:8].lower().startswith(('http://', 'https://')):
+        return False
+    return _URL_RE.match(url) is not None
 
 
+def ensure_dir(path: str):
+    """Create a directory (and parents) once per process lifetime."""
+    if path in _known_dirs:
+        return
+    os.makedirs(path, exist_ok=True)
+    with _known_dirs_lock:
+        _known_dirs.add(path)
+
+
+@functools.lru_cache(maxsize=4096)
 def format_size(bytes_size: Optional[int]) -> str:
     """Format bytes to human readable size string."""
     if bytes_size is None or bytes_size == 0:
         return "Unknown"
-    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
-        if bytes_size < 1024:
-            return f"{bytes_size:.1f} {unit}"
-        bytes_size /= 1024
-    return f"{bytes_size:.1f} PB"
+    # Unit index from the bit length: each unit step is 10 bits (1024)
+    idx = min(max((int(bytes_size).bit_length() - 1) // 10, 0), len(_SIZE_UNITS) - 1)
+    return f"{bytes_size / (1 << (10 * idx)):.1f} {_SIZE_UNITS[idx]}"
 
 
 def format_duration(seconds: Optional[int]) -> str:
@@ -151,34 +256,224 @@ def format_duration(seconds: Optional[int]) -> str:
     return f"{minutes}:{secs:02d}"
 
 
+def reap_finished_downloads():
+    """
+    Background loop that evicts finished downloads from active_downloads.
+    Keeps memory bounded for long-running servers; entries in a terminal
+    state are dropped once older than DOWNLOAD_RETENTION_SECONDS.
+    """
+    while True:
+        time.sleep(REAPER_INTERVAL_SECONDS)
+        now = datetime.now()
+        for download_id, info in list(active_downloads.items()):
+            with info['lock']:
+                finished_key = TERMINAL_STATES.get(info.get('status'))
+                finished_at = info.get(finished_key) if finished_key else None
+            if not finished_at:
+                continue
+            try:
+                age = (now - datetime.fromisoformat(finished_at)).total_seconds()
+            except ValueError:
+                continue
+            if age > DOWNLOAD_RETENTION_SECONDS:
+                active_downloads.pop(download_id, None)
+
+
+def snapshot_download(info: Dict) -> Dict:
+    """Return a JSON-serializable copy of a download record (without its lock)."""
+    with info['lock']:
+        return {k: v for k, v in info.items() if k != 'lock'}
+
+
 def broadcast_progress(download_id: str, progress_data: Dict):
     """
     Broadcast progress update to all connected SSE clients.
-    Thread-safe queue push for each client.
+    Only enqueues onto the central event queue, so download threads never
+    do per-client work; fan-out happens in dispatch_progress_events.
     """
     event_data = {
         'download_id': download_id,
         **progress_data,
-        'timestamp': datetime.now().isoformat()
+        'timestamp': time.time()  # Epoch seconds; cheaper than isoformat per tick
     }
     
-    # Push to all client queues
-    dead_clients = []
-    for client_id, q in list(progress_queues.items()):
+    put_coalescing(progress_events, event_data, wait=TERMINAL_EVENT_TIMEOUT)
+
+
+def put_coalescing(q: queue.Queue, event_data: Dict, wait: float = 0.0) -> bool:
+    """
+    Queue an event without letting a full queue lose terminal events.
+    
+    Terminal events are those whose status is in TERMINAL_STATES
+    (completed/failed/cancelled); every other event (starting, downloading,
+    converting) is transient. When the queue is full, the oldest pending
+    transient event is evicted to make room. If the queue holds only terminal
+    events, the new event is dropped, unless it is terminal and wait > 0, in
+    which case it waits up to `wait` seconds for room. Fan-out to client
+    queues uses wait=0 so one stalled client never blocks the others.
+    Returns False if any event was dropped.
+    """
+    try:
+        q.put_nowait(event_data)
+        return True
+    except queue.Full:
+        pass
+    
+    # gevent queues have no mutex: greenlets cannot switch inside this block
+    with getattr(q, 'mutex', None) or contextlib.nullcontext():
+        for i, queued in enumerate(q.queue):
+            if queued.get('status') not in TERMINAL_STATES:
+                del q.queue[i]
+                q.queue.append(event_data)
+                return False
+    
+    if wait > 0 and event_data.get('status') in TERMINAL_STATES:
         try:
-            q.put_nowait(event_data)
+            q.put(event_data, timeout=wait)
+            return True
         except queue.Full:
+            pass
+    
+    if event_data.get('status') in TERMINAL_STATES:
+        logger.warning(f"Dropped terminal event for download {event_data.get('download_id')}")
+    return False
+
+
+def sse_message(event: Dict) -> bytes:
+    """Encode an event as an SSE 'data:' message, using orjson when available."""
+    if orjson is not None:
+        return b"data: " + orjson.dumps(event) + b"\n\n"
+    return f"data: {json.dumps(event)}\n\n".encode('utf-8')
+
+
+def dispatch_progress_events():
+    """
+    Background loop fanning progress events out to every SSE client queue.
+    """
+    while True:
+        event_data = progress_events.get()
+        try:
+            fan_out_progress(event_data)
+        except Exception as e:
+            logger.error(f"Progress dispatch error: {e}")
+
+
+def new_client_queue():
+    """Create an SSE client queue (a greenlet-native queue under gevent)."""
+    if gevent is not None:
+        return gevent.queue.Queue(maxsize=CLIENT_QUEUE_SIZE)
+    return queue.Queue(maxsize=CLIENT_QUEUE_SIZE)
+
+
+def add_progress_client(client_id: str, q: queue.Queue):
+    """Register an SSE client queue and refresh the broadcast snapshot."""
+    global _queues_snapshot
+    with _queues_lock:
+        progress_queues[client_id] = q
+        _queues_snapshot = tuple(progress_queues.items())
+
+
+def record_client_drop(client_id: str) -> int:
+    """Count a dropped event for a connected client; returns its running total."""
+    with _queues_lock:
+        if client_id not in progress_queues:
+            return 0
+        drops = drops_by_client.get(client_id, 0) + 1
+        drops_by_client[client_id] = drops
+        return drops
+
+
+def take_client_drops(client_id: str) -> int:
+    """Return and reset the number of events dropped for a client."""
+    with _queues_lock:
+        return drops_by_client.pop(client_id, 0)
+
+
+def remove_progress_client(client_id: str):
+    """Unregister an SSE client queue and refresh the broadcast snapshot."""
+    global _queues_snapshot
+    with _queues_lock:
+        progress_queues.pop(client_id, None)
+        drops_by_client.pop(client_id, None)
+        _queues_snapshot = tuple(progress_queues.items())
+
+
+def fan_out_progress(event_data: Dict):
+    """Push a single progress event to all connected SSE client queues."""
+    # Push to all client queues; on overflow progress events are coalesced so
+    # a slow client sees the latest state instead of losing its stream
+    dead_clients = []
+    for client_id, q in _queues_snapshot:
+        if put_coalescing(q, event_data):
+            continue
+        if record_client_drop(client_id) >= MAX_CLIENT_DROPS:
             dead_clients.append(client_id)
     
-    # Clean up dead clients
+    # Clean up clients that have stopped consuming entirely
     for client_id in dead_clients:
-        progress_queues.pop(client_id, None)
+        remove_progress_client(client_id)
 
 
 # ============================================================================
 # YT-DLP INTEGRATION
 # ============================================================================
 
+# Options for metadata extraction (flat detects playlists, full gets formats)
+FLAT_INFO_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'extract_flat': 'in_playlist',  # Only flatten playlists
+    'skip_download': True,
+}
+
+FULL_INFO_OPTS = {
+    'quiet': True,
+    'no_warnings': True,
+    'extract_flat': False,
+    'skip_download': True,
+}
+
+# URL fragments indicating a playlist/channel; these go straight to the flat probe
+_PLAYLIST_MARKERS = ('list=', '/playlist', '/channel/', '/c/', '/@', '/user/', '/browse/')
+
+# Unprocessed result types resolved with flat extraction ('url' redirects may
+# point at a playlist; if they resolve to a video, the flat result is used as-is)
+_COLLECTION_TYPES = ('playlist', 'multi_video', 'url')
+
+# Long-lived YoutubeDL instances for metadata extraction, one per option-set
+# per worker thread (a YoutubeDL object is not safe to share across threads)
+_info_ydl_local = threading.local()
+_info_ydl_instances: List[yt_dlp.YoutubeDL] = []
+_info_ydl_lock = threading.Lock()
+
+
+def get_info_ydl(flat: bool) -> yt_dlp.YoutubeDL:
+    """
+    Return the calling thread's cached YoutubeDL instance for metadata extraction.
+    Reusing the instance keeps extractors and HTTP connections warm across requests.
+    """
+    key = 'flat' if flat else 'full'
+    ydl = getattr(_info_ydl_local, key, None)
+    if ydl is None:
+        ydl = yt_dlp.YoutubeDL(FLAT_INFO_OPTS if flat else FULL_INFO_OPTS)
+        setattr(_info_ydl_local, key, ydl)
+        with _info_ydl_lock:
+            _info_ydl_instances.append(ydl)
+    return ydl
+
+
+@atexit.register
+def close_info_ydls():
+    """Close all cached metadata YoutubeDL instances on shutdown."""
+    with _info_ydl_lock:
+        for ydl in _info_ydl_instances:
+            try:
+                ydl.close()
+            except Exception:
+                pass
+        _info_ydl_instances.clear()
+
+
 def extract_single_video_info(info: Dict, url: str) -> Dict[str, Any]:
     """
     Extract metadata from a single video info dict.
@@ -249,6 +544,7 @@ def extract_single_video_info(info: Dict, url: str) -> Dict[str, Any]:
         'platform': platform,
         'extractor': extractor,
         'webpage_url': video_url,
+        'protocol': info.get('protocol'),  # e.g. 'https', 'm3u8_native+https'
         'resolutions': resolution_options if resolution_options else ['1080p', '720p', '480p', '360p'],
         'video_formats': video_formats[:20],
         'audio_formats': audio_formats[:10],
@@ -257,27 +553,122 @@ def extract_single_video_info(info: Dict, url: str) -> Dict[str, Any]:
     }
 
 
-def get_video_info(url: str) -> Dict[str, Any]:
+def iter_playlist_videos(playlist_info: Dict, url: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yield a video info dict for each usable entry of an extracted playlist.
+    Uses the (flat) entry data directly; full extraction happens at download time.
+    """
+    playlist_title = playlist_info.get('title', 'Unknown Playlist')
+    playlist_uploader = playlist_info.get('uploader', 'Unknown')
+    
+    # Detect if this is a YouTube Music playlist
+    is_youtube_music = 'music.youtube.com' in url
+    base_url = "https://music.youtube.com/watch?v=" if is_youtube_music else "https://www.youtube.com/watch?v="
+    platform = 'Youtube Music' if is_youtube_music else 'Youtube'
+    
+    # FAST: Use flat extraction data directly instead of fetching each video
+    # Full extraction will happen at download time
+    for i, entry in enumerate(playlist_info.get('entries') or ()):
+        if entry is None:
+            continue
+        
+        # Construct video URL (prefer the page URL: on processed entries 'url'
+        # may be the expiring media URL of the selected format)
+        video_url = entry.get('webpage_url') or entry.get('url')
+        if not video_url and entry.get('id'):
+            video_url = f"{base_url}{entry.get('id')}"
+        
+        if not video_url:
+            continue
+        
+        # Use flat extraction data - this is fast!
+        yield {
+            'success': True,
+            'url': video_url,
+            'id': entry.get('id'),
+            'title': entry.get('title', f'Video {i+1}'),
+            'duration': entry.get('duration'),
+            'duration_string': format_duration(entry.get('duration')),
+            'thumbnail': entry.get('thumbnail') or entry.get('thumbnails', [{}])[0].get('url') if entry.get('thumbnails') else None,
+            'uploader': entry.get('uploader') or entry.get('channel') or playlist_uploader,
+            'view_count': entry.get('view_count'),
+            'platform': platform,
+            'playlist_index': i + 1,
+            'playlist_title': playlist_title,
+            # Default resolutions - actual ones determined at download time
+            'resolutions': ['2160p', '1440p', '1080p', '720p', '480p', '360p'],
+            'available_containers': ['mp4', 'mkv', 'webm'],
+            'available_audio_bitrates': ['128', '192', '320'],
+        }
+
+
+def build_playlist_info(playlist_info: Dict, url: str, stream: bool = False) -> Dict[str, Any]:
+    """
+    Build the /api/info response for a playlist from its extracted info dict.
+    
+    With stream=True, 'videos' is left as a generator (and no 'video_count'
+    is set) so the caller can emit one video at a time instead of holding
+    every video dict of a large playlist in memory.
+    """
+    playlist_title = playlist_info.get('title', 'Unknown Playlist')
+    playlist_uploader = playlist_info.get('uploader', 'Unknown')
+    
+    logger.info(f"Detected playlist: {playlist_title}")
+    
+    playlist = {
+        'success': True,
+        'is_playlist': True,
+        'playlist_title': playlist_title,
+        'playlist_uploader': playlist_uploader,
+        'playlist_url': url,
+    }
+    
+    if stream:
+        playlist['videos'] = iter_playlist_videos(playlist_info, url)
+        return playlist
+    
+    videos = list(iter_playlist_videos(playlist_info, url))
+    
+    if not videos:
+        return {'error': 'Playlist is empty'}
+    
+    logger.info(f"Playlist processed: {len(videos)} videos ready")
+    
+    playlist['video_count'] = len(videos)
+    playlist['videos'] = videos
+    return playlist
+
+
+def get_video_info(url: str, stream: bool = False) -> Dict[str, Any]:
     """
     Fetch video metadata using yt-dlp without downloading.
     Supports both single videos and playlists.
     
-    For playlists: Returns a dict with is_playlist=True and a list of videos.
+    For playlists: Returns a dict with is_playlist=True and a list of videos
+    (a generator of videos when stream=True, see build_playlist_info).
     For single videos: Returns a dict with the video info.
+    
+    URLs with a playlist marker go straight to flat extraction. Other URLs are
+    classified with one unprocessed extraction: single videos are processed
+    from that same result (one extractor pass), while collections are
+    resolved flat so their entries are never fully extracted.
     """
     url = sanitize_url(url)
     
-    # First, do a flat extraction to detect if it's a playlist
-    flat_opts = {
-        'quiet': True,
-        'no_warnings': True,
-        'extract_flat': 'in_playlist',  # Only flatten playlists
-        'skip_download': True,
-    }
-    
     try:
-        with yt_dlp.YoutubeDL(flat_opts) as ydl:
-            flat_info = ydl.extract_info(url, download=False)
+        ydl_full = get_info_ydl(flat=False)
+        ie_result = None
+        
+        if not any(marker in url for marker in _PLAYLIST_MARKERS):
+            # Classify the URL without resolving entries or formats
+            ie_result = ydl_full.extract_info(url, download=False, process=False)
+            
+            if ie_result is None:
+                return {'error': 'Could not extract video information'}
+        
+        if ie_result is None or ie_result.get('_type') in _COLLECTION_TYPES:
+            # Flat extraction to detect if it's a playlist
+            flat_info = get_info_ydl(flat=True).extract_info(url, download=False)
             
             if flat_info is None:
                 return {'error': 'Could not extract video information'}
@@ -286,89 +677,30 @@ def get_video_info(url: str) -> Dict[str, Any]:
             is_playlist = flat_info.get('_type') == 'playlist' or 'entries' in flat_info
             
             if is_playlist and 'entries' in flat_info:
-                entries = list(flat_info.get('entries', []))
-                
-                if not entries:
-                    return {'error': 'Playlist is empty'}
-                
-                playlist_title = flat_info.get('title', 'Unknown Playlist')
-                playlist_uploader = flat_info.get('uploader', 'Unknown')
-                
-                logger.info(f"Detected playlist: {playlist_title} with {len(entries)} videos")
-                
-                # Detect if this is a YouTube Music playlist
-                is_youtube_music = 'music.youtube.com' in url
-                base_url = "https://music.youtube.com/watch?v=" if is_youtube_music else "https://www.youtube.com/watch?v="
-                platform = 'Youtube Music' if is_youtube_music else 'Youtube'
-                
-                # FAST: Use flat extraction data directly instead of fetching each video
-                # Full extraction will happen at download time
-                videos = []
-                for i, entry in enumerate(entries):
-                    if entry is None:
-                        continue
-                    
-                    # Construct video URL
-                    video_url = entry.get('url') or entry.get('webpage_url')
-                    if not video_url and entry.get('id'):
-                        video_url = f"{base_url}{entry.get('id')}"
-                    
-                    if not video_url:
-                        continue
-                    
-                    # Use flat extraction data - this is fast!
-                    videos.append({
-                        'success': True,
-                        'url': video_url,
-                        'id': entry.get('id'),
-                        'title': entry.get('title', f'Video {i+1}'),
-                        'duration': entry.get('duration'),
-                        'duration_string': format_duration(entry.get('duration')),
-                        'thumbnail': entry.get('thumbnail') or entry.get('thumbnails', [{}])[0].get('url') if entry.get('thumbnails') else None,
-                        'uploader': entry.get('uploader') or entry.get('channel') or playlist_uploader,
-                        'view_count': entry.get('view_count'),
-                        'platform': platform,
-                        'playlist_index': i + 1,
-                        'playlist_title': playlist_title,
-                        # Default resolutions - actual ones determined at download time
-                        'resolutions': ['2160p', '1440p', '1080p', '720p', '480p', '360p'],
-                        'available_containers': ['mp4', 'mkv', 'webm'],
-                        'available_audio_bitrates': ['128', '192', '320'],
-                    })
-                
-                logger.info(f"Playlist processed: {len(videos)} videos ready")
-                
-                return {
-                    'success': True,
-                    'is_playlist': True,
-                    'playlist_title': playlist_title,
-                    'playlist_uploader': playlist_uploader,
-                    'playlist_url': url,
-                    'video_count': len(videos),
-                    'videos': videos,
-                }
+                return build_playlist_info(flat_info, url, stream)
             
-            else:
-                # Single video - do full extraction
-                full_opts = {
-                    'quiet': True,
-                    'no_warnings': True,
-                    'extract_flat': False,
-                    'skip_download': True,
-                }
-                
-                with yt_dlp.YoutubeDL(full_opts) as ydl_full:
-                    info = ydl_full.extract_info(url, download=False)
-                    
-                    if info is None:
-                        return {'error': 'Could not extract video information'}
-                    
-                    # Handle case where single video still has entries (some extractors)
-                    if 'entries' in info and info['entries']:
-                        info = info['entries'][0]
-                    
-                    return extract_single_video_info(info, url)
+            # extract_flat only flattens playlist entries, so a single video
+            # (e.g. behind a redirect/short link) is already fully resolved
+            if flat_info.get('formats'):
+                return extract_single_video_info(flat_info, url)
             
+            ie_result = None
+        
+        # Single video - do full extraction (reusing the classified result)
+        if ie_result is None:
+            info = ydl_full.extract_info(url, download=False)
+        else:
+            info = ydl_full.process_ie_result(ie_result, download=False)
+        
+        if info is None:
+            return {'error': 'Could not extract video information'}
+        
+        # Handle case where single video still has entries (some extractors)
+        if 'entries' in info and info['entries']:
+            info = info['entries'][0]
+        
+        return extract_single_video_info(info, url)
+        
     except yt_dlp.DownloadError as e:
         logger.error(f"yt-dlp download error for {url}: {e}")
         return {'error': f'Download error: {str(e)}'}
@@ -377,21 +709,115 @@ def get_video_info(url: str) -> Dict[str, Any]:
         return {'error': f'Failed to fetch video info: {str(e)}'}
 
 
+# Parallel fragment downloads: fragmented (HLS/DASH) streams get more workers;
+# the setting is ignored for progressive downloads
+DEFAULT_FRAGMENT_CONCURRENCY = 5
+FRAGMENTED_FRAGMENT_CONCURRENCY = 16
+FRAGMENTED_PROTOCOLS = {'m3u8', 'm3u8_native', 'http_dash_segments', 'http_dash_segments_generator'}
+
+# yt-dlp options shared by every download
+STATIC_DOWNLOAD_OPTS = {
+    'http_chunk_size': 10_485_760,  # Use 10 MB range requests for progressive streams
+    'retries': 3,
+    'fragment_retries': 3,
+    'ignoreerrors': False,
+    'no_warnings': False,
+    'quiet': False,
+    'noprogress': False,
+    # FFmpeg location (use system ffmpeg)
+    'ffmpeg_location': None,
+}
+
+# Subtitle options for video downloads (opt-in via include_subtitles; the
+# FFmpegEmbedSubtitle postprocessor embeds them, costing extra requests and a remux)
+SUBTITLE_OPTS = {
+    'writesubtitles': True,
+    'subtitleslangs': ['en'],
+}
+
+# Video containers yt-dlp can embed a thumbnail into (mp3 covers audio-only)
+THUMBNAIL_CONTAINERS = {'mp4', 'mkv'}
+
+
+@functools.lru_cache(maxsize=64)
+def download_opts_template(resolution: str, container: str, audio_only: bool, audio_bitrate: str,
+                           include_subtitles: bool, embed_thumbnail: bool) -> tuple:
+    """
+    Build the per-settings part of the yt-dlp options, cached per settings tuple.
+    
+    Returns an immutable (format_str, postprocessors, merge_format) tuple;
+    postprocessors is a tuple of (key, value) item tuples to be turned back
+    into fresh dicts for each download.
+    """
+    # Build format string based on resolution
+    if audio_only:
+        format_str = 'bestaudio/best'
+    else:
+        # Parse resolution (e.g., '720p' -> 720)
+        height = resolution.rstrip('p') if resolution != 'best' else None
+        if height and height.isdigit():
+            format_str = f'bestvideo[height<={height}]+bestaudio/best[height<={height}]/best'
+        else:
+            format_str = 'bestvideo+bestaudio/best'
+    
+    # Postprocessors run after download/merge, in the same order as the CLI
+    postprocessors = ()
+    
+    # Audio extraction postprocessor
+    if audio_only:
+        postprocessors += ((
+            ('key', 'FFmpegExtractAudio'),
+            ('preferredcodec', 'mp3'),
+            ('preferredquality', audio_bitrate),
+        ),)
+    
+    # Embed the downloaded subtitles, removing the sidecar file
+    if include_subtitles and not audio_only:
+        postprocessors += ((
+            ('key', 'FFmpegEmbedSubtitle'),
+            ('already_have_subtitle', False),
+        ),)
+    
+    # Embed the downloaded thumbnail, removing the image file
+    if embed_thumbnail:
+        postprocessors += ((
+            ('key', 'EmbedThumbnail'),
+            ('already_have_thumbnail', False),
+        ),)
+    
+    # Merge format for video downloads
+    merge_format = None if audio_only else container
+    
+    return format_str, postprocessors, merge_format
+
+
 def create_progress_hook(download_id: str):
     """
     Create a progress hook function for yt-dlp.
     
     yt-dlp calls progress hooks with status updates during download.
     We broadcast these updates to connected SSE clients.
+    
+    'downloading' updates are rate limited to PROGRESS_MIN_INTERVAL since
+    fragmented streams (HLS/DASH) fire them for every fragment; 'finished'
+    and 'error' always pass through.
     """
+    state = {'last': 0.0}
+    
     def progress_hook(d):
         status = d.get('status', 'unknown')
         
         if status == 'downloading':
-            # Calculate progress
-            downloaded = d.get('downloaded_bytes', 0)
-            total = d.get('total_bytes') or d.get('total_bytes_estimate', 0)
-            speed = d.get('speed', 0)
+            now = time.monotonic()
+            if now - state['last'] < PROGRESS_MIN_INTERVAL:
+                return
+            state['last'] = now
+            
+            # Calculate progress (whole bytes, so format_size's cache can hit;
+            # yt-dlp reports speed and size estimates as floats)
+            downloaded = int(d.get('downloaded_bytes') or 0)
+            total = int(d.get('total_bytes') or d.get('total_bytes_estimate') or 0)
+            speed = int(d.get('speed') or 0)
             eta = d.get('eta', 0)
             
             percent = (downloaded / total * 100) if total > 0 else 0
@@ -407,9 +833,10 @@ def create_progress_hook(download_id: str):
             }
             
             # Update active downloads
-            with downloads_lock:
-                if download_id in active_downloads:
-                    active_downloads[download_id].update(progress_data)
+            info = active_downloads.get(download_id)
+            if info:
+                with info['lock']:
+                    info.update(progress_data)
             
             broadcast_progress(download_id, progress_data)
             
@@ -444,6 +871,9 @@ def download_video(download_id: str, url: str, options: Dict) -> Dict:
         - output_filename: Custom filename
         - download_dir: Target directory
         - create_subfolder: Create Video/Audio subfolders
+        - protocol: Protocol reported by /api/info (selects fragment concurrency)
+        - include_subtitles: Fetch and embed English subtitles (video only)
+        - embed_thumbnail: Embed the thumbnail into the output file (mp3/mp4/mkv)
     """
     url = sanitize_url(url)
     
@@ -455,6 +885,9 @@ def download_video(download_id: str, url: str, options: Dict) -> Dict:
     custom_filename = options.get('output_filename', '')
     download_dir = options.get('download_dir', DEFAULT_DOWNLOAD_DIR)
     create_subfolder = options.get('create_subfolder', True)
+    protocol = options.get('protocol') or ''
+    include_subtitles = options.get('include_subtitles', False)
+    embed_thumbnail = options.get('embed_thumbnail', False)
     
     # Sanitize filename if provided
     if custom_filename:
@@ -464,7 +897,7 @@ def download_video(download_id: str, url: str, options: Dict) -> Dict:
     if create_subfolder:
         subfolder = 'Audio' if audio_only else 'Video'
         download_dir = os.path.join(download_dir, subfolder)
-    os.makedirs(download_dir, exist_ok=True)
+    ensure_dir(download_dir)
     
     # Build output template
     if custom_filename:
@@ -472,59 +905,45 @@ def download_video(download_id: str, url: str, options: Dict) -> Dict:
     else:
         output_template = os.path.join(download_dir, '%(title)s.%(ext)s')
     
-    # Build format string based on resolution
-    if audio_only:
-        format_str = 'bestaudio/best'
-    else:
-        # Parse resolution (e.g., '720p' -> 720)
-        height = resolution.rstrip('p') if resolution != 'best' else None
-        if height and height.isdigit():
-            format_str = f'bestvideo[height<={height}]+bestaudio/best[height<={height}]/best'
-        else:
-            format_str = 'bestvideo+bestaudio/best'
+    # Subtitles only apply to video; thumbnails need a container that supports them
+    include_subtitles = bool(include_subtitles) and not audio_only
+    embed_thumbnail = bool(embed_thumbnail) and (audio_only or container in THUMBNAIL_CONTAINERS)
+    
+    # Format string, postprocessors and merge format are cached per settings
+    format_str, postprocessors, merge_format = download_opts_template(
+        str(resolution), str(container), bool(audio_only), str(audio_bitrate),
+        include_subtitles, embed_thumbnail)
     
     # yt-dlp options
     ydl_opts = {
+        **STATIC_DOWNLOAD_OPTS,
         'format': format_str,
         'outtmpl': output_template,
         'progress_hooks': [create_progress_hook(download_id)],
-        'concurrent_fragment_downloads': 5,  # Parallel fragment downloads
-        'retries': 3,
-        'fragment_retries': 3,
-        'ignoreerrors': False,
-        'no_warnings': False,
-        'quiet': False,
-        'noprogress': False,
-        # Merge format for video downloads
-        'merge_output_format': container if not audio_only else None,
-        # Embed metadata
-        'embedmetadata': True,
-        'embedthumbnail': True,
-        # FFmpeg location (use system ffmpeg)
-        'ffmpeg_location': None,
+        'merge_output_format': merge_format,
+        'concurrent_fragment_downloads': (
+            FRAGMENTED_FRAGMENT_CONCURRENCY
+            if FRAGMENTED_PROTOCOLS.intersection(str(protocol).split('+'))
+            else DEFAULT_FRAGMENT_CONCURRENCY
+        ),
     }
     
-    # Audio extraction postprocessor
-    if audio_only:
-        ydl_opts['postprocessors'] = [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': audio_bitrate,
-        }]
-    else:
-        # Embed subtitles if available
-        ydl_opts['writesubtitles'] = True
-        ydl_opts['subtitleslangs'] = ['en']
-        ydl_opts['embedsubtitles'] = True
+    if postprocessors:
+        ydl_opts['postprocessors'] = [dict(pp) for pp in postprocessors]
+    if embed_thumbnail:
+        ydl_opts['writethumbnail'] = True
+    if include_subtitles:
+        ydl_opts.update(SUBTITLE_OPTS, subtitleslangs=list(SUBTITLE_OPTS['subtitleslangs']))
     
     # Update download status
-    with downloads_lock:
-        active_downloads[download_id] = {
-            'status': 'starting',
-            'url': url,
-            'options': options,
-            'started_at': datetime.now().isoformat(),
-        }
+    download_info = {
+        'status': 'starting',
+        'url': url,
+        'options': options,
+        'started_at': datetime.now().isoformat(),
+        'lock': threading.Lock(),
+    }
+    active_downloads[download_id] = download_info
     
     broadcast_progress(download_id, {'status': 'starting', 'message': 'Initializing download...'})
     
@@ -542,12 +961,9 @@ def download_video(download_id: str, url: str, options: Dict) -> Dict:
             if info is None:
                 raise Exception("No video found")
             
-            # Get final filename
-            filename = ydl.prepare_filename(info)
-            if audio_only:
-                filename = os.path.splitext(filename)[0] + '.mp3'
-            else:
-                filename = os.path.splitext(filename)[0] + f'.{container}'
+            # Get final filename (extension changes after merging/conversion)
+            base, _ = os.path.splitext(ydl.prepare_filename(info))
+            filename = f"{base}.{'mp3' if audio_only else container}"
             
             result = {
                 'success': True,
@@ -560,8 +976,8 @@ def download_video(download_id: str, url: str, options: Dict) -> Dict:
             }
             
             # Update status
-            with downloads_lock:
-                active_downloads[download_id].update({
+            with download_info['lock']:
+                download_info.update({
                     'status': 'completed',
                     **result
                 })
@@ -584,8 +1000,8 @@ def download_video(download_id: str, url: str, options: Dict) -> Dict:
             'failed_at': datetime.now().isoformat(),
         }
         
-        with downloads_lock:
-            active_downloads[download_id].update({
+        with download_info['lock']:
+            download_info.update({
                 'status': 'failed',
                 **result
             })
@@ -595,6 +1011,11 @@ def download_video(download_id: str, url: str, options: Dict) -> Dict:
         return result
 
 
+# Start background cleanup of finished downloads and SSE event dispatch
+threading.Thread(target=reap_finished_downloads, name='reaper', daemon=True).start()
+threading.Thread(target=dispatch_progress_events, name='sse-dispatch', daemon=True).start()
+
+
 # ============================================================================
 # API ROUTES
 # ============================================================================
@@ -614,7 +1035,11 @@ def fetch_info():
         { "urls": ["url1", "url2", ...] }
     
     Returns:
-        List of video info objects
+        List of video info objects. If the client sends
+        "Accept: application/x-ndjson", results are streamed instead, one
+        JSON object per line in URL order: single videos and errors are one
+        line each; a playlist is a header line (is_playlist=True, no videos),
+        one line per video, then {"type": "playlist_end", "video_count": N}.
     """
     data = request.get_json()
     
@@ -635,11 +1060,34 @@ def fetch_info():
     if not valid_urls:
         return jsonify({'error': 'No valid URLs provided'}), 400
     
-    # Fetch info for each URL (can be parallelized for many URLs)
-    results = []
-    for url in valid_urls:
-        info = get_video_info(url)
-        results.append(info)
+    # Fetch info for all URLs in parallel (network-bound), preserving order
+    stream = request.accept_mimetypes.best == 'application/x-ndjson'
+    futures = [info_executor.submit(get_video_info, url, stream) for url in valid_urls]
+    
+    if stream:
+        def info_stream():
+            for f in futures:
+                info = f.result()
+                if not info.get('is_playlist'):
+                    yield json.dumps(info) + '\n'
+                    continue
+                
+                videos = info.pop('videos')
+                yield json.dumps(info) + '\n'
+                count = 0
+                for video in videos:
+                    count += 1
+                    yield json.dumps(video) + '\n'
+                
+                logger.info(f"Playlist streamed: {count} videos")
+                end = {'type': 'playlist_end', 'playlist_url': info['playlist_url'], 'video_count': count}
+                if not count:
+                    end['error'] = 'Playlist is empty'
+                yield json.dumps(end) + '\n'
+        
+        return Response(stream_with_context(info_stream()), mimetype='application/x-ndjson')
+    
+    results = [f.result() for f in futures]
     
     return jsonify({'success': True, 'videos': results})
 
@@ -660,7 +1108,10 @@ def start_download():
                     "audio_bitrate": "192",
                     "output_filename": "custom_name",
                     "download_dir": "/path/to/dir",
-                    "create_subfolder": true
+                    "create_subfolder": true,
+                    "protocol": "m3u8_native",  // Optional, from /api/info
+                    "include_subtitles": false,
+                    "embed_thumbnail": false
                 },
                 ...
             ],
@@ -675,20 +1126,20 @@ def start_download():
     downloads = data['downloads']
     global_dir = data.get('download_dir', DEFAULT_DOWNLOAD_DIR)
     
-    download_ids = []
-    
+    # Validate all URLs up front
+    valid_items = []
     for item in downloads:
         url = item.get('url', '').strip()
-        
-        if not url or not validate_url(url):
-            continue
-        
-        # Generate unique download ID
-        download_id = str(uuid.uuid4())[:8]
-        download_ids.append(download_id)
-        
-        # Merge options
-        options = {
+        if url and validate_url(url):
+            valid_items.append((url, item))
+    
+    # Generate unique download IDs from a single urandom call
+    id_pool = secrets.token_hex(4 * len(valid_items))
+    download_ids = [id_pool[i * 8:(i + 1) * 8] for i in range(len(valid_items))]
+    
+    # Merge options
+    prepared = [
+        (download_id, url, {
             'resolution': item.get('resolution', 'best'),
             'format': item.get('format', 'mp4'),
             'audio_only': item.get('audio_only', False),
@@ -696,11 +1147,16 @@ def start_download():
             'output_filename': item.get('output_filename', ''),
             'download_dir': item.get('download_dir', global_dir),
             'create_subfolder': item.get('create_subfolder', True),
-        }
-        
-        # Submit to thread pool for concurrent execution
-        executor.submit(download_video, download_id, url, options)
-        
+            'protocol': item.get('protocol', ''),
+            'include_subtitles': item.get('include_subtitles', False),
+            'embed_thumbnail': item.get('embed_thumbnail', False),
+        })
+        for download_id, (url, item) in zip(download_ids, valid_items)
+    ]
+    
+    # Submit to thread pool for concurrent execution
+    for download_id, url, options in prepared:
+        download_executor.submit(download_video, download_id, url, options)
         logger.info(f"Started download {download_id} for {url}")
     
     return jsonify({
@@ -713,20 +1169,20 @@ def start_download():
 @app.route('/api/status/<download_id>')
 def get_download_status(download_id: str):
     """Get status of a specific download."""
-    with downloads_lock:
-        if download_id in active_downloads:
-            return jsonify(active_downloads[download_id])
+    info = active_downloads.get(download_id)
+    if info:
+        return jsonify(snapshot_download(info))
     return jsonify({'error': 'Download not found'}), 404
 
 
 @app.route('/api/status')
 def get_all_status():
     """Get status of all active downloads."""
-    with downloads_lock:
-        return jsonify({
-            'active_downloads': list(active_downloads.values()),
-            'total': len(active_downloads)
-        })
+    downloads = [snapshot_download(info) for info in list(active_downloads.values())]
+    return jsonify({
+        'active_downloads': downloads,
+        'total': len(downloads)
+    })
 
 
 @app.route('/api/cancel/<download_id>', methods=['POST'])
@@ -736,11 +1192,13 @@ def cancel_download(download_id: str):
     Note: yt-dlp doesn't support graceful cancellation easily.
     This marks it as cancelled but may not stop the actual process.
     """
-    with downloads_lock:
-        if download_id in active_downloads:
-            active_downloads[download_id]['status'] = 'cancelled'
-            broadcast_progress(download_id, {'status': 'cancelled'})
-            return jsonify({'success': True, 'message': 'Download cancelled'})
+    info = active_downloads.get(download_id)
+    if info:
+        with info['lock']:
+            info['status'] = 'cancelled'
+            info['cancelled_at'] = datetime.now().isoformat()
+        broadcast_progress(download_id, {'status': 'cancelled'})
+        return jsonify({'success': True, 'message': 'Download cancelled'})
     return jsonify({'error': 'Download not found'}), 404
 
 
@@ -749,7 +1207,7 @@ def get_history():
     """Get download history."""
     return jsonify({
         'success': True,
-        'history': download_history[-50:]  # Last 50 downloads
+        'history': list(download_history)  # Last HISTORY_LIMIT downloads
     })
 
 
@@ -772,24 +1230,29 @@ def sse_events():
     4. Frontend updates UI cards based on download_id
     """
     def event_stream():
-        client_id = str(uuid.uuid4())
-        q = queue.Queue(maxsize=100)
-        progress_queues[client_id] = q
+        client_id = secrets.token_hex(8)
+        q = new_client_queue()
+        add_progress_client(client_id, q)
         
         try:
             # Send initial connection confirmation
-            yield f"data: {json.dumps({'type': 'connected', 'client_id': client_id})}\n\n"
+            yield sse_message({'type': 'connected', 'client_id': client_id})
             
             while True:
                 try:
                     # Wait for events with timeout
                     event = q.get(timeout=30)
-                    yield f"data: {json.dumps(event)}\n\n"
+                    yield sse_message(event)
+                    
+                    # Report events lost to backpressure since the last read
+                    drops = take_client_drops(client_id)
+                    if drops:
+                        yield sse_message({'type': 'drops', 'count': drops})
                 except queue.Empty:
                     # Send keepalive
-                    yield f": keepalive\n\n"
+                    yield b": keepalive\n\n"
         finally:
-            progress_queues.pop(client_id, None)
+            remove_progress_client(client_id)
     
     return Response(
         event_stream(),
@@ -809,7 +1272,8 @@ def get_config():
         'default_download_dir': DEFAULT_DOWNLOAD_DIR,
         'supported_formats': ['mp4', 'mkv', 'webm'],
         'supported_bitrates': ['128', '192', '320'],
-        'max_concurrent': 5,
+        'max_concurrent': MAX_CONCURRENT_DOWNLOADS,
+        'max_concurrent_info': MAX_CONCURRENT_INFO,
     })
 
 
@@ -847,5 +1311,10 @@ if __name__ == '__main__':
 ================================================================
     """)
     
-    # Run Flask development server
-    app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
+    if WSGIServer is not None:
+        # gevent server: one greenlet per connection (SSE clients are cheap)
+        logger.info("Serving with gevent WSGIServer on port 5000")
+        WSGIServer(('0.0.0.0', 5000), app).serve_forever()
+    else:
+        # Run Flask development server
+        app.run(host='0.0.0.0', port=5000, debug=True, threaded=True)
@@ -25,6 +25,8 @@ const state = {
     settings: {
         downloadDir: '',
         createSubfolders: true,
+        includeSubtitles: false,
+        embedThumbnail: false,
         concurrentDownloads: 3
     },
     eventSource: null,    // SSE connection
@@ -72,6 +74,8 @@ const elements = {
     saveSettings: document.getElementById('saveSettings'),
     downloadDir: document.getElementById('downloadDir'),
     createSubfolders: document.getElementById('createSubfolders'),
+    includeSubtitles: document.getElementById('includeSubtitles'),
+    embedThumbnail: document.getElementById('embedThumbnail'),
 
     historyBtn: document.getElementById('historyBtn'),
     historyModal: document.getElementById('historyModal'),
@@ -255,6 +259,7 @@ function createVideoCard(video, index) {
     card.id = cardId;
     card.dataset.url = video.url || video.webpage_url;
     card.dataset.index = index;
+    card.dataset.protocol = video.protocol || '';
 
     card.innerHTML = `
         <div class="video-card-content">
@@ -349,7 +354,10 @@ function getCardConfig(card) {
         audio_bitrate: card.querySelector('.bitrate-select').value,
         output_filename: card.querySelector('.filename-input').value.trim(),
         download_dir: state.settings.downloadDir || '',
-        create_subfolder: state.settings.createSubfolders
+        create_subfolder: state.settings.createSubfolders,
+        include_subtitles: state.settings.includeSubtitles,
+        embed_thumbnail: state.settings.embedThumbnail,
+        protocol: card.dataset.protocol || ''
     };
 }
 
@@ -460,6 +468,11 @@ function connectSSE() {
                 return;
             }
 
+            if (data.type === 'drops') {
+                console.warn(`SSE: ${data.count} progress event(s) dropped (slow consumer)`);
+                return;
+            }
+
             // Update card progress
             if (data.download_id) {
                 updateCardProgress(data.download_id, data);
@@ -918,6 +931,8 @@ function init() {
     elements.saveSettings.addEventListener('click', () => {
         state.settings.downloadDir = elements.downloadDir.value;
         state.settings.createSubfolders = elements.createSubfolders.checked;
+        state.settings.includeSubtitles = elements.includeSubtitles.checked;
+        state.settings.embedThumbnail = elements.embedThumbnail.checked;
         closeModal(elements.settingsModal);
         showToast('Settings saved', 'success');
     });